@@ -1,90 +1,76 @@
 # --- app-v2.py
-import os
-import json
-import requests
+import time
 import streamlit as st
-from streamlit_autorefresh import st_autorefresh 
 
-default_base_url = os.getenv('OLLAMA_HOST')
+from ollama_client import (
+    default_base_url,
+    get_pulled_models,
+    make_chat_streamer,
+    parse_pull_status,
+    pull_stream,
+)
 
 # --- Streamlit Page Title ---
 st.set_page_config(page_title="Ollama Chat", page_icon="🤖")
 
-# --- Helpers ---
-def check_ollama_health(base_url=None):
-    base_url = base_url or default_base_url
-    try:
-        r = requests.get(f"{base_url}/api/tags", timeout=2)
-        if r.status_code == 200:
-            return True, r.json()  # expected to be a dict possibly containing "models"
-        return False, f"Unexpected status: {r.status_code}"
-    except requests.RequestException as e:
-        return False, str(e)
-
-def get_pulled_models(base_url=None):
-    base_url = base_url or default_base_url
-    try:
-        r = requests.get(f"{base_url}/api/tags", timeout=2)
-        r.raise_for_status()
-        data = r.json()
-        models = [m["name"] for m in data.get("models", [])]
-        return models, data
-    except requests.RequestException as e:
-        return [], str(e)
-
-def pull_model_stream(model_name, base_url=None):
-    """Generator that yields lines of progress from the /api/pull endpoint."""
-    base_url = base_url or default_base_url
-    url = f"{base_url}/api/pull"
-    try:
-        with requests.post(url, json={"name": model_name}, stream=True) as r:
-            r.raise_for_status()
-            for raw in r.iter_lines():
-                if raw:
-                    yield raw.decode("utf-8", errors="replace")
-    except requests.RequestException as e:
-        # yield a single error line so caller can display it
-        yield f"ERROR: {e}"
+# available models you want to allow pulling from (tuple: built once at import)
+AVAILABLE_MODELS = ("llama3.1:8b", "llama3:7b", "llama2:13b")
 
 # --- Sidebar ---
 with st.sidebar:
     # --- Controls ---
     st.title("⚙️  Controls")
-    base_url = st.sidebar.text_input("Ollama Base URL", value=default_base_url, help="e.g., http://ollama:11434")
 
-    # sidebar inputs
+    # sidebar inputs, grouped in a form so edits only trigger a rerun on
+    # Apply, not on every keystroke in the Base URL box
     # model_choice = st.selectbox("Choose model:", ["llama3.1:8b", "llama3:7b", "llama2:13b"], help="Set model you want to use.\nNote: this will need to be pulled and available in the local Ollama server.")
-    temperature = st.slider("Temperature", 0.0, 1.5, 0.7)
-    max_tokens = st.sidebar.number_input("Max Tokens (0 = Ollama default)", min_value=0, value=0, step=100)
-    clear = st.sidebar.button("Clear chat history")
+    with st.form("config", clear_on_submit=False):
+        base_url = st.text_input("Ollama Base URL", value=default_base_url, help="e.g., http://ollama:11434")
+        temperature = st.slider("Temperature", 0.0, 1.5, 0.7)
+        max_tokens = st.number_input("Max Tokens (0 = Ollama default)", min_value=0, value=0, step=100)
+        st.form_submit_button("Apply")
+    clear = st.button("Clear chat history")
 
     # --- Healthcheck ---
-    # Use a container so only this part refreshes
-    # built-in auto-refresh
-    st_autorefresh(interval=5*60*1000, key="ollama_health")
-
-    pulled_models, health_raw = get_pulled_models()
+    @st.fragment(run_every="5m")
+    def health_status():
+        # run_every re-executes just this fragment instead of the whole
+        # script, replacing the old page-wide st_autorefresh; the timestamp
+        # gate keeps fragment reruns off the network while the result is
+        # fresh (the missing-key check matters: monotonic() is small right
+        # after host boot, so the timestamp alone can look "fresh" on a
+        # first-ever run)
+        if (
+            "_last_health_result" not in st.session_state
+            or time.monotonic() - st.session_state.get("_last_health_ts", 0) >= 30
+        ):
+            st.session_state["_last_health_result"] = get_pulled_models(base_url)
+            st.session_state["_last_health_ts"] = time.monotonic()
+        models, _, health_raw = st.session_state["_last_health_result"]
+
+        if models:
+            st.success("✅ Ollama healthy")
+            st.info("Pulled: " + ", ".join(models))
+        else:
+            # If health_raw is a string it's likely an error message; otherwise just show no models
+            if isinstance(health_raw, str):
+                st.error(f"❌ Healthcheck failed: {health_raw}")
+            else:
+                st.info("No models pulled yet.")
+
+    health_status()
+    # the fragment call above has (re)filled the snapshot for this run
+    pulled_models, pulled_set, health_raw = st.session_state["_last_health_result"]
     if pulled_models:
-        st.success("✅ Ollama healthy")
-        st.info("Pulled: " + ", ".join(pulled_models))
-
         # 🔑 Only allow choosing from *pulled models*
         chosen_model = st.selectbox("Choose model", pulled_models)
         st.session_state["chosen_model"] = chosen_model
 
-    else:
-        # If health_raw is a string it's likely an error message; otherwise just show no models
-        if isinstance(health_raw, str):
-            st.error(f"❌ Healthcheck failed: {health_raw}")
-        else:
-            st.info("No models pulled yet.")
-
     st.markdown("---")
     st.subheader("⬇️ Pull Model")
 
-    # available models you want to allow pulling from
-    available_models = ["llama3.1:8b", "llama3:7b", "llama2:13b"]
-    models_to_pull = [m for m in available_models if m not in pulled_models]
+    # frozenset membership makes this O(len(AVAILABLE_MODELS)) per rerun
+    models_to_pull = [m for m in AVAILABLE_MODELS if m not in pulled_set]
 
     pull_section = st.container()
     with pull_section:
@@ -96,16 +82,30 @@ with st.sidebar:
                 # stream the pull output line by line
                 with st.spinner(f"Pulling {pull_choice}..."):
                     last_line = ""
-                    for line in pull_model_stream(pull_choice):
+                    last_update = 0.0
+                    prev_status = None
+                    for line in pull_stream(pull_choice, base_url):
                         last_line = line
-                        # show the latest progress line (overwrite)
-                        progress_placeholder.text(line)
-                    # after streaming finishes, re-check the pulled models to confirm
-                    new_pulled, _ = get_pulled_models()
-                    if pull_choice in new_pulled:
+                        # Throttle progress pushes — each one is a websocket
+                        # message and Ollama emits many lines per second
+                        status = parse_pull_status(line)
+                        now = time.monotonic()
+                        if status != prev_status or now - last_update > 0.2:
+                            progress_placeholder.text(line)
+                            prev_status = status
+                            last_update = now
+                    # always render the final progress line
+                    if last_line:
+                        progress_placeholder.text(last_line)
+                    # after streaming finishes, drop the cached tag list and re-check to confirm
+                    get_pulled_models.clear()
+                    _, new_pulled_set, _ = get_pulled_models(base_url)
+                    if pull_choice in new_pulled_set:
                         st.success(f"✅ {pull_choice} pulled successfully")
-                        # force a rerun so the sidebar re-queries /api/tags and the dropdown updates
-                        st.experimental_rerun()
+                        # invalidate the session-state health snapshot, then rerun so
+                        # the sidebar re-queries /api/tags and the dropdown updates
+                        st.session_state["_last_health_ts"] = 0
+                        st.rerun()
                     else:
                         # If we didn't find the model, try to present helpful info
                         st.error(f"❌ Pull finished but {pull_choice} not in pulled models.")
@@ -123,55 +123,23 @@ if "messages" not in st.session_state or clear:
 st.title("💬 Ollama Chat")
 st.caption("This interface connects to your local Ollama server and streams the responses.")
 
-# --- Helper: Stream from Ollama /api/chat ---
-def stream_chat_ollama(messages, *, model, base_url, temperature=0.7, max_tokens=0):
-    """
-    Yields chunks of text from Ollama's /api/chat streaming endpoint.
-    """
-    url = base_url.rstrip("/") + "/api/chat"
-    payload = {
-        "model": model,
-        "messages": messages,
-        "stream": True,
-        "options": {"temperature": float(temperature)},
-    }
-    if max_tokens and int(max_tokens) > 0:
-        payload["options"]["num_predict"] = int(max_tokens)
-
-    try:
-        with requests.post(url, json=payload, stream=True, timeout=600) as r:
-            r.raise_for_status()
-            for line in r.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                # Ollama streams json per line
-                try:
-                    data = json.loads(line)
-                except json.JSONDecodeError:
-                    # Skip non-JSON lines just in case
-                    continue
-
-                if "error" in data:
-                    # Surface errors from Ollama
-                    raise RuntimeError(data["error"])
-
-                # Each chunk has optional message.content and a done flag
-                msg = data.get("message", {})
-                chunk = msg.get("content", "")
-                if chunk:
-                    yield chunk
-                if data.get("done"):
-                    break
-    except requests.exceptions.RequestException as e:
-        # Connection / HTTP issues
-        raise RuntimeError(f"Failed to reach Ollama at {base_url}: {e}") from e
+# read the chosen model safely
+model = st.session_state.get("chosen_model")
+if not model:
+    st.warning("No model selected. Either pull a model or wait until Ollama is healthy.")
 
 # --- Render history (skip initial system message) ---
-for m in st.session_state.messages:
-    if m["role"] == "system":
-        continue
-    with st.chat_message(m["role"]):
-        st.markdown(m["content"])
+@st.fragment
+def render_history():
+    # As a fragment this only re-executes on full-script reruns (e.g. a new
+    # chat message), not on reruns triggered inside other fragments
+    for m in st.session_state.messages:
+        if m["role"] == "system":
+            continue
+        with st.chat_message(m["role"]):
+            st.markdown(m["content"])
+
+render_history()
 
 # --- Input box ---
 user_prompt = st.chat_input("Type your message")
@@ -184,20 +152,14 @@ if user_prompt:
 
     # Prepare assistant container
     with st.chat_message("assistant"):
-        # Stream the response and collect it so we can append to history
-        full_response = ""
+        # st.write_stream renders each chunk and returns the joined text,
+        # so no per-token string concatenation is needed here
         try:
-            # Stream chunks into the UI
-            for chunk in st.write_stream(
-                stream_chat_ollama(
-                    st.session_state.messages,
-                    model=model,
-                    base_url=base_url,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
-            ):
-                full_response += chunk
+            # the streamer is specialized (and cached) per (base_url, model)
+            streamer = make_chat_streamer(base_url, model)
+            full_response = st.write_stream(
+                streamer(st.session_state.messages, temperature, max_tokens)
+            )
         except Exception as e:
             st.error(str(e))
             full_response = ""
@@ -108,7 +108,7 @@ with st.sidebar:
                     if pull_choice in new_pulled:
                         st.success(f"✅ {pull_choice} pulled successfully")
                         # force a rerun so the sidebar re-queries /api/tags and the dropdown updates
-                        st.experimental_rerun()
+                        st.rerun()
                     else:
                         # If we didn't find the model, try to present helpful info
                         st.error(f"❌ Pull finished but {pull_choice} not in pulled models.")
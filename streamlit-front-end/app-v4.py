@@ -1,91 +1,16 @@
 # --- app-v4.py
-import os
-import json
-import requests
+import time
 import streamlit as st
-from streamlit_autorefresh import st_autorefresh  
+
+from ollama_client import (
+    default_base_url,
+    get_pulled_models,
+    make_chat_streamer,
+    parse_pull_status,
+    pull_stream,
+)
 
 st.set_page_config(page_title="Ollama Experiments", page_icon="🤖")
-default_base_url = os.getenv('OLLAMA_HOST')
-
-# --- Helper: Get List of pulled models ---
-def get_pulled_models(base_url=None):
-    base_url = base_url or default_base_url
-
-    try:
-        r = requests.get(f"{base_url}/api/tags", timeout=3)
-        r.raise_for_status()
-        data = r.json()
-        # Ollama typically returns {"models": [{"name": "llama3.1:8b", ...}, ...]}
-        models = [m.get("name") if isinstance(m, dict) else str(m) for m in data.get("models", [])]
-        return models, data
-
-    except requests.RequestException as e:
-        return [], str(e)
-
-# --- Helper: Get List of pulled models ---
-def pull_model_stream(model_name, base_url=None):
-    base_url = base_url or default_base_url
-
-    url = f"{base_url}/api/pull"
-
-    try:
-        with requests.post(url, json={"name": model_name}, stream=True) as r:
-            r.raise_for_status()
-            for raw in r.iter_lines():
-                if raw:
-                    yield raw.decode("utf-8", errors="replace")
-
-    except requests.RequestException as e:
-        yield f"ERROR: {e}"
-
-# --- Helper: Stream from Ollama /api/chat ---
-def stream_chat_ollama(messages, *, model, base_url=None, temperature=0.7, max_tokens=0):
-
-    """
-    Yields chunks of text from Ollama's /api/chat streaming endpoint.
-    """
-
-    url = base_url.rstrip("/") + "/api/chat"
-
-    payload = {
-        "model": model,
-        "messages": messages,
-        "stream": True,
-        "options": {"temperature": float(temperature)},
-    }
-
-    if max_tokens and int(max_tokens) > 0:
-        payload["options"]["num_predict"] = int(max_tokens)
-
-    try:
-        with requests.post(url, json=payload, stream=True, timeout=600) as r:
-            r.raise_for_status()
-            for line in r.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                # Ollama streams json per line
-                try:
-                    data = json.loads(line)
-                except json.JSONDecodeError:
-                    # Skip non-JSON lines just in case
-                    continue
-
-                if "error" in data:
-                    # Surface errors from Ollama
-                    raise RuntimeError(data["error"])
-
-                # Each chunk has optional message.content and a done flag
-                msg = data.get("message", {})
-                chunk = msg.get("content", "")
-                if chunk:
-                    yield chunk
-                if data.get("done"):
-                    break
-
-    except requests.exceptions.RequestException as e:
-        # Connection / HTTP issues
-        raise RuntimeError(f"Failed to reach Ollama at {base_url}: {e}") from e
 
 # --- Ensure session_state key exists so code later can safely read it ---
 if "chosen_model" not in st.session_state:
@@ -96,33 +21,49 @@ with st.sidebar:
     # --- Sidebar: Ollama Controls
     st.title("⚙️  AI Controls")
 
-    # --- Setup
-    base_url = st.sidebar.text_input("Ollama Base URL", value=default_base_url, help="e.g., http://ollama:11434")
-    temperature = st.slider("Temperature", 0.0, 1.5, 0.7)
-    max_tokens = st.sidebar.number_input("Max Tokens (0 = Ollama default)", min_value=0, value=0, step=100)
-    clear = st.sidebar.button("Clear chat history")
+    # --- Setup: grouped in a form so edits only trigger a rerun on Apply,
+    # not on every keystroke in the Base URL box
+    with st.form("config", clear_on_submit=False):
+        base_url = st.text_input("Ollama Base URL", value=default_base_url, help="e.g., http://ollama:11434")
+        temperature = st.slider("Temperature", 0.0, 1.5, 0.7)
+        max_tokens = st.number_input("Max Tokens (0 = Ollama default)", min_value=0, value=0, step=100)
+        st.form_submit_button("Apply")
+    clear = st.button("Clear chat history")
 
     # --- Sidebar: Ollama Health / Status
     st.markdown("---")
     st.subheader("🩺 Ollama Status")
-    pulled_models, health_info = get_pulled_models()
-
-    # Use a container so only this part refreshes
-    health_placeholder = st.empty()
-
-    # auto-refresh the sidebar every 10s (updates health & pulled models)
-    st_autorefresh(interval=5*60*1000, key="ollama_health")
 
-    if isinstance(health_info, str):
-        # health_info is an error message
-        st.error(f"❌ Healthcheck failed: {health_info}")
-    else:
-        # container is healthy
-        st.success("✅ Ollama healthy")
-        if pulled_models:
-            st.info("Pulled: " + ", ".join(pulled_models))
+    @st.fragment(run_every="5m")
+    def health_status():
+        # run_every re-executes just this fragment instead of the whole
+        # script, replacing the old page-wide st_autorefresh; the timestamp
+        # gate keeps fragment reruns off the network while the result is
+        # fresh (the missing-key check matters: monotonic() is small right
+        # after host boot, so the timestamp alone can look "fresh" on a
+        # first-ever run)
+        if (
+            "_last_health_result" not in st.session_state
+            or time.monotonic() - st.session_state.get("_last_health_ts", 0) >= 30
+        ):
+            st.session_state["_last_health_result"] = get_pulled_models(base_url)
+            st.session_state["_last_health_ts"] = time.monotonic()
+        models, _, health_info = st.session_state["_last_health_result"]
+
+        if isinstance(health_info, str):
+            # health_info is an error message
+            st.error(f"❌ Healthcheck failed: {health_info}")
         else:
-            st.info("No models pulled yet.")
+            # container is healthy
+            st.success("✅ Ollama healthy")
+            if models:
+                st.info("Pulled: " + ", ".join(models))
+            else:
+                st.info("No models pulled yet.")
+
+    health_status()
+    # the fragment call above has (re)filled the snapshot for this run
+    pulled_models, pulled_set, health_info = st.session_state["_last_health_result"]
 
     # --- Sidebar: Choose Model
     st.markdown("---")
@@ -131,7 +72,7 @@ with st.sidebar:
     # If there are pulled models, ensure session_state has a valid default and bind selectbox to it
     if pulled_models:
         # if current chosen_model is missing or no longer valid, default to first pulled model
-        if st.session_state.get("chosen_model") not in pulled_models:
+        if st.session_state.get("chosen_model") not in pulled_set:
             st.session_state["chosen_model"] = pulled_models[0]
         # bind selectbox to session_state["chosen_model"] so it always exists after this point
         st.selectbox("Choose model:", options=pulled_models, key="chosen_model")
@@ -150,15 +91,30 @@ with st.sidebar:
         progress = st.empty()
         with st.spinner(f"Pulling {model_to_pull}..."):
             last_line = ""
-            for line in pull_model_stream(model_to_pull.strip()):
+            last_update = 0.0
+            prev_status = None
+            for line in pull_stream(model_to_pull.strip(), base_url):
                 last_line = line
-                progress.text(line)
-            # after pull attempt, re-check pulled models
-            new_pulled, _ = get_pulled_models()
-            if model_to_pull.strip() in new_pulled:
+                # Throttle progress pushes — each one is a websocket message
+                # to the browser and Ollama emits many lines per second
+                status = parse_pull_status(line)
+                now = time.monotonic()
+                if status != prev_status or now - last_update > 0.2:
+                    progress.text(line)
+                    prev_status = status
+                    last_update = now
+            # always render the final progress line
+            if last_line:
+                progress.text(last_line)
+            # after pull attempt, drop the cached tag list and re-check pulled models
+            get_pulled_models.clear()
+            _, new_pulled_set, _ = get_pulled_models(base_url)
+            if model_to_pull.strip() in new_pulled_set:
                 st.success(f"✅ {model_to_pull} pulled successfully")
-                # force a rerun so the Choose-model selectbox refreshes
-                st.experimental_rerun()
+                # invalidate the session-state health snapshot, then rerun so
+                # the Choose-model selectbox refreshes
+                st.session_state["_last_health_ts"] = 0
+                st.rerun()
             else:
                 st.error(f"❌ Pull finished but {model_to_pull} not found in pulled models.")
                 st.text("Last output:\n" + (last_line or "<no output>"))
@@ -182,11 +138,17 @@ else:
     st.warning("No model selected. Either pull a model or wait until Ollama is healthy.")
 
 # --- Render history (skip initial system message) ---
-for m in st.session_state.messages:
-    if m["role"] == "system":
-        continue
-    with st.chat_message(m["role"]):
-        st.markdown(m["content"])
+@st.fragment
+def render_history():
+    # As a fragment this only re-executes on full-script reruns (e.g. a new
+    # chat message), not on reruns triggered inside other fragments
+    for m in st.session_state.messages:
+        if m["role"] == "system":
+            continue
+        with st.chat_message(m["role"]):
+            st.markdown(m["content"])
+
+render_history()
 
 # --- Input box ---
 user_prompt = st.chat_input("Type your message")
@@ -199,20 +161,14 @@ if user_prompt:
 
     # Prepare assistant container
     with st.chat_message("assistant"):
-        # Stream the response and collect it so we can append to history
-        full_response = ""
+        # st.write_stream renders each chunk and returns the joined text,
+        # so no per-token string concatenation is needed here
         try:
-            # Stream chunks into the UI
-            for chunk in st.write_stream(
-                stream_chat_ollama(
-                    st.session_state.messages,
-                    model=model,
-                    base_url=base_url,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
-            ):
-                full_response += chunk
+            # the streamer is specialized (and cached) per (base_url, model)
+            streamer = make_chat_streamer(base_url, model)
+            full_response = st.write_stream(
+                streamer(st.session_state.messages, temperature, max_tokens)
+            )
         except Exception as e:
             st.error(str(e))
             full_response = ""
@@ -0,0 +1,256 @@
+# --- ollama_client.py
+"""
+Shared Ollama HTTP helpers for the Streamlit front-end scripts.
+
+app-v2.py and app-v4.py (app.py) import from here so there is a single
+cache_resource Session and a single cache_data tag-list cache regardless
+of which variant is running.
+
+Transport note: Ollama serves its API over plain HTTP/1.1, so switching
+to httpx with http2=True would buy nothing here (h2 is only negotiated
+via TLS ALPN) while adding a dependency. The pooled keep-alive Session
+below already multiplexes tags/pull/chat over persistent connections.
+"""
+import os
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter, Retry
+import streamlit as st
+
+# Prefer orjson for the per-token parse in the streaming hot loop
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# Static headers for the streaming chat POST, built once instead of per turn
+_STREAM_HEADERS = {"Content-Type": "application/json", "Accept-Encoding": "identity"}
+
+# Resolve OLLAMA_HOST once at import. Helpers validate the base URL before
+# touching requests, so a missing/broken setting never pays the expensive
+# exception path through requests on every rerun (e.g. "None/api/tags").
+default_base_url = (os.getenv('OLLAMA_HOST') or "http://localhost:11434").rstrip("/")
+
+
+def _valid_base(base_url):
+    """Normalize a base URL, or return None when it can't be used."""
+    base_url = (base_url or default_base_url or "").rstrip("/")
+    parts = urlsplit(base_url)
+    if parts.scheme in ("http", "https") and parts.netloc:
+        return base_url
+    return None
+
+
+# Pre-built endpoint URLs so rerun hot paths skip per-call f-string
+# formatting and rstrip when the default base URL is in use
+_TAGS_URL = default_base_url + "/api/tags"
+_CHAT_URL = default_base_url + "/api/chat"
+_PULL_URL = default_base_url + "/api/pull"
+
+
+@st.cache_resource
+def get_session():
+    """
+    Return a pooled requests.Session, cached across Streamlit reruns so the
+    underlying keep-alive connections to Ollama are reused.
+    """
+    s = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.1),
+    )
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def check_ollama_health(base_url=None):
+    """Return (healthy, tags-json-or-error-string) for the Ollama server."""
+    base_url = _valid_base(base_url)
+    if base_url is None:
+        return False, "OLLAMA_HOST not configured"
+    url = _TAGS_URL if base_url == default_base_url else base_url + "/api/tags"
+    try:
+        r = get_session().get(url, timeout=2)
+        if r.status_code == 200:
+            return True, r.json()  # expected to be a dict possibly containing "models"
+        return False, f"Unexpected status: {r.status_code}"
+    except requests.RequestException as e:
+        return False, str(e)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_pulled_models(base_url):
+    """Return (models, model_set, tags-json-or-error-string) for base_url.
+
+    model_set is a frozenset of the same names, built once per cache entry
+    so callers get O(1) membership checks on every rerun.
+    """
+    # base_url is an explicit arg so it is part of the cache key
+    base_url = _valid_base(base_url)
+    if base_url is None:
+        return [], frozenset(), "OLLAMA_HOST not configured"
+    url = _TAGS_URL if base_url == default_base_url else base_url + "/api/tags"
+    sess = get_session()
+
+    try:
+        r = sess.get(url, timeout=3)
+        r.raise_for_status()
+        data = r.json()
+        # Ollama typically returns {"models": [{"name": "llama3.1:8b", ...}, ...]}
+        models = [m.get("name") if isinstance(m, dict) else str(m) for m in data.get("models", [])]
+        return models, frozenset(models), data
+
+    except requests.RequestException as e:
+        return [], frozenset(), str(e)
+
+
+def pull_stream(model_name, base_url=None):
+    """Generator that yields lines of progress from the /api/pull endpoint."""
+    base_url = _valid_base(base_url)
+    if base_url is None:
+        yield "ERROR: OLLAMA_HOST not configured"
+        return
+    url = _PULL_URL if base_url == default_base_url else base_url + "/api/pull"
+    sess = get_session()
+
+    try:
+        with sess.post(url, json={"name": model_name}, stream=True) as r:
+            r.raise_for_status()
+            for raw in r.iter_lines():
+                if raw:
+                    yield raw.decode("utf-8", errors="replace")
+
+    except requests.RequestException as e:
+        # yield a single error line so caller can display it
+        yield f"ERROR: {e}"
+
+
+def parse_pull_status(line):
+    """Best-effort extraction of the status field from a pull progress line."""
+    try:
+        data = _json.loads(line)
+    except _json.JSONDecodeError:
+        return None
+    return data.get("status") if isinstance(data, dict) else None
+
+
+@st.cache_resource
+def make_chat_streamer(base_url, model):
+    """
+    Specialize the chat stream for one (base_url, model) pair.
+
+    URL validation, endpoint selection and session lookup happen once per
+    pair for the lifetime of the process; the returned callable only
+    serializes the payload and streams.
+    """
+    base_url = _valid_base(base_url)
+    if base_url is None:
+        raise RuntimeError("OLLAMA_HOST not configured")
+    url = _CHAT_URL if base_url == default_base_url else base_url + "/api/chat"
+    sess = get_session()
+
+    def stream(messages, temperature=0.7, max_tokens=0):
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            "options": {"temperature": float(temperature)},
+        }
+
+        if max_tokens and int(max_tokens) > 0:
+            payload["options"]["num_predict"] = int(max_tokens)
+
+        # Serialize the (growing) messages list once, outside requests' own
+        # json= path; orjson returns bytes, the stdlib fallback a str
+        body = _json.dumps(payload)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        # An explicit Content-Length on the bytes body guarantees headers and
+        # payload go out in a single write (http.client coalesces them), so the
+        # first streamed token isn't stalled behind an extra round-trip. Nagle
+        # is a non-issue: urllib3's default socket options set TCP_NODELAY.
+        headers = dict(_STREAM_HEADERS, **{"Content-Length": str(len(body))})
+
+        try:
+            # identity encoding keeps Ollama from gzip-buffering the stream;
+            # the large chunk size keeps newline scanning out of the per-token path
+            with sess.post(
+                url,
+                data=body,
+                stream=True,
+                timeout=600,
+                headers=headers,
+            ) as r:
+                r.raise_for_status()
+                # Frame the NDJSON stream ourselves: bytearray.find scans for the
+                # newline in C, where iter_lines re-buffers and scans in Python
+                tail = bytearray()
+                # Coalesce tiny content fragments so st.write_stream isn't
+                # asked to paint a frame per single-character chunk
+                buffered = []
+                buffered_len = 0
+                last_flush = time.monotonic()
+                for buf in r.iter_content(chunk_size=65536, decode_unicode=False):
+                    tail += buf
+                    while (nl := tail.find(b"\n")) != -1:
+                        line = bytes(tail[:nl])
+                        del tail[:nl + 1]
+                        # The stream is documented NDJSON, so a one-byte sniff is
+                        # enough to skip blanks without a per-line try frame; a
+                        # truly malformed line raises to the outer handler below
+                        if not line or line[:1] not in (b"{", b"["):
+                            continue
+                        data = _json.loads(line)
+
+                        # done first: the final line (and heartbeats) carry no
+                        # useful content, so skip the message handling for them
+                        if data.get("done"):
+                            chunk = data.get("message", {}).get("content", "")
+                            if chunk:
+                                buffered.append(chunk)
+                            if buffered:
+                                yield "".join(buffered)
+                            return
+
+                        if "error" in data:
+                            # Surface errors from Ollama
+                            raise RuntimeError(data["error"])
+
+                        chunk = data.get("message", {}).get("content", "")
+                        if not chunk:
+                            continue
+                        buffered.append(chunk)
+                        buffered_len += len(chunk)
+                        now = time.monotonic()
+                        if buffered_len > 16 or now - last_flush > 0.03:
+                            yield "".join(buffered)
+                            buffered.clear()
+                            buffered_len = 0
+                            last_flush = now
+
+                # stream ended without a done marker — flush what we have
+                if buffered:
+                    yield "".join(buffered)
+
+        except _json.JSONDecodeError as e:
+            # A malformed line means the stream itself is broken — stop and surface it
+            raise RuntimeError(f"Malformed stream from Ollama: {e}") from e
+        except requests.exceptions.RequestException as e:
+            # Connection / HTTP issues
+            raise RuntimeError(f"Failed to reach Ollama at {base_url}: {e}") from e
+
+    return stream
+
+
+def stream_chat(messages, *, model, base_url=None, temperature=0.7, max_tokens=0):
+    """
+    Yields chunks of text from Ollama's /api/chat streaming endpoint.
+
+    Thin wrapper over make_chat_streamer so existing call sites keep their
+    keyword signature while sharing the cached specialization.
+    """
+    yield from make_chat_streamer(base_url, model)(messages, temperature, max_tokens)